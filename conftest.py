@@ -0,0 +1 @@
+# Repo kökü sys.path'e eklenir; testler "import main" ile düz `pytest` altında da çalışır
@@ -1,32 +1,157 @@
 import os
+import re
 import asyncio
+import random
 import aiohttp
-import json
+import orjson
+import pickle
+import pathlib
 import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 import gspread
-from bs4 import BeautifulSoup
+import pandas as pd
+from lxml import etree
 from google.oauth2.service_account import Credentials
-import re
 
 # --- Configuration ---
 PRISYNC_SITELIST_URL_TEMPLATE = "https://prisync.me/admin/fetchField/siteList/Site_page/{}/Site_sort/id.desc"
-SPREADSHEET_NAME = 'New FF Alert'
+SPREADSHEET_NAME = os.environ.get("SPREADSHEET_NAME", 'New FF Alert')
+# Çalışmalar arası ID önbelleği (workflow'da actions/cache ile saklanır)
+ID_CACHE_PATH = pathlib.Path(os.environ.get("ID_CACHE_PATH", "ids.pkl"))
 
 # Concurrency settings
 CONCURRENT_REQUESTS = 20
 START_PAGE = 1
 END_PAGE = 92 
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+# Retry settings (429 / geçici 5xx / bağlantı hataları)
+MAX_ATTEMPTS = 4
+MAX_BACKOFF = 10
+# Sayfa başına toplam bekleme bütçesi; Retry-After bunu aşarsa sayfadan vazgeçilir
+MAX_RETRY_WAIT = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# HTML parsing (compiled once, reused for every page)
+ROW_XPATH = etree.XPath(
+    '//*[@id="ff-grid"]//table[contains(concat(" ", normalize-space(@class), " "), " items ")]'
+    '/tbody/tr[count(td) >= 3]'
+)
+CELLS_XPATH = etree.XPath('td')
+# Parse işi event loop dışında. Tek HTMLParser örneği kilitli olduğundan
+# her thread kendi parser'ını kullanır; böylece parse'lar gerçekten paralel çalışır
+PARSE_WORKERS = 4
+_thread_local = threading.local()
+EXECUTOR = ThreadPoolExecutor(max_workers=PARSE_WORKERS)
+
+# ID temizleme (modül seviyesinde bir kez derlenir)
+# Önce tam sayısal hücre ("12345", "3615.0", "-7") tam eşleşme ile denenir, tamsayı kısmı alınır
+_NUM_RE = re.compile(r'^-?(\d+)(?:\.\d+)?$')
+# Eşleşmeyenler için yedek: metin içindeki ilk sayı grubu ("site_id=12345")
+_ID_RE = re.compile(r'(\d+)')
+_TRANS = str.maketrans('', '', ',')
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def _parse_retry_after(value):
+    # Retry-After: saniye ("120") ya da HTTP-date ("Wed, 21 Oct 2026 07:28:00 GMT")
+    value = value.strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0)
+
+def _get_parser(encoding):
+    # Thread başına, encoding başına bir parser
+    parsers = getattr(_thread_local, "parsers", None)
+    if parsers is None:
+        parsers = _thread_local.parsers = {}
+    parser = parsers.get(encoding)
+    if parser is None:
+        try:
+            parser = etree.HTMLParser(encoding=encoding)
+        except LookupError:
+            # Sunucu tanınmayan bir charset bildirdi
+            parser = etree.HTMLParser(encoding="utf-8")
+        parsers[encoding] = parser
+    return parser
+
+def _cell_text(cell):
+    # BeautifulSoup get_text(strip=True) ile aynı: her parça str.strip(), araya ayraç yok
+    return "".join(text.strip() for text in cell.itertext())
+
+def parse_html(raw: bytes, encoding="utf-8"):
+    # Modül seviyesinde: ProcessPoolExecutor'a geçilirse pickle edilebilir.
+    # encoding HTTP Content-Type'tan gelir; <meta charset> olmayan parçalı
+    # cevaplarda libxml2 aksi halde Latin-1 varsayar
+    data = []
+    # Grid yoksa (boş/sonuçsuz sayfa) DOM kurmaya gerek yok
+    if b'ff-grid' not in raw:
+        return data
+    try:
+        tree = etree.fromstring(raw, _get_parser(encoding))
+        if tree is None:
+            return data
+        for row in ROW_XPATH(tree):
+            cells = CELLS_XPATH(row)
+            # Boşluk kontrolü Python'da: XPath normalize-space() &nbsp; (U+00A0) silmez,
+            # CGridView boş hücreleri &nbsp; olarak basar
+            seller_name = _cell_text(cells[2])
+            if not seller_name:
+                data.append({"ID": _cell_text(cells[0]), "Site": _cell_text(cells[1])})
+    except Exception:
+        pass
+    return data
+
+def _extract_ids(data_rows):
+    # Vektörel geçiş: virgülleri sil, sayısal hücrelerde tamsayı kısmını al,
+    # kalanlarda ilk sayı grubunu çek, boşları at
+    # "site_id=12345" -> "12345", 3615.0 -> "3615"
+    values = pd.Series([row[0] for row in data_rows if row], dtype=object)
+    cleaned = values.astype(str).str.translate(_TRANS)
+    ids = cleaned.str.extract(_NUM_RE, expand=False)
+    missing = ids.isna()
+    if missing.any():
+        ids[missing] = cleaned[missing].str.extract(_ID_RE, expand=False)
+    return ids.dropna()
+
+def create_session():
+    # Tüm çalışma için tek oturum: scraper ve Slack aynı bağlantı havuzunu kullanır.
+    # Prisync header/cookie'leri istek bazında gönderilir, Slack'e sızmaz.
+    # Havuz worker sayısına eşit; TCP+TLS bağlantıları sayfalar arasında yeniden kullanılır
+    connector = aiohttp.TCPConnector(
+        limit=CONCURRENT_REQUESTS,
+        limit_per_host=CONCURRENT_REQUESTS,
+        use_dns_cache=True,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=REQUEST_TIMEOUT,
+        cookie_jar=aiohttp.DummyCookieJar(),
+    )
+
 class GoogleSheetsManager:
     def __init__(self, spreadsheet_name):
         self.spreadsheet_name = spreadsheet_name
         self.client = None
         self.sheet = None
-        self.existing_ids = set()
+        self.existing_ids = frozenset()
+        self.ids_loaded = False
 
     def connect(self):
         try:
@@ -34,7 +159,7 @@ class GoogleSheetsManager:
                 'https://www.googleapis.com/auth/spreadsheets',
                 'https://www.googleapis.com/auth/drive'
             ]
-            json_creds = json.loads(os.environ["GSPREAD_JSON"])
+            json_creds = orjson.loads(os.environ["GSPREAD_JSON"])
             creds = Credentials.from_service_account_info(json_creds, scopes=scopes)
             self.client = gspread.authorize(creds)
             self.sheet = self.client.open(self.spreadsheet_name).get_worksheet(0)
@@ -58,137 +183,160 @@ class GoogleSheetsManager:
         """
         Gelişmiş ID Okuyucu:
         Google Sheets'ten gelen veri ne kadar bozuk formatta olursa olsun (3.62E+8, 123.0, vb.)
-        içindeki gerçek tamsayı ID'yi regex ile söküp alır.
+        içindeki gerçek tamsayı ID'yi tek bir vektörel regex ile söküp alır.
+        Diskte önbellek varsa sadece önbellekten sonra eklenen satırlar (kuyruk) okunur.
         """
+        cached_rows, cached_last, cached_ids = self._load_id_cache()
+        # Sheets okuması patlarsa en azından önbellekteki ID'lerle dedup yapılır
+        self.existing_ids = cached_ids
+        self.ids_loaded = bool(cached_ids)
         try:
-            # col_values yerine get_all_values kullanarak tüm tabloyu garantiye alıyoruz
-            all_rows = self.sheet.get_all_values()
-            
-            # Başlık satırını atla (ilk satır)
-            if all_rows:
-                data_rows = all_rows[1:]
-            else:
-                data_rows = []
-
-            count = 0
-            for row in data_rows:
-                # Eğer satır boşsa atla
-                if not row: continue
-                
-                # A sütunu (ID) ilk elemandır
-                raw_val = str(row[0]).strip()
-                
-                if not raw_val: continue
-
-                # Regex ile sadece sayıları çek (En güvenli yöntem)
-                # "site_id=12345" -> "12345" bulur
-                # "12345.0" -> "12345" bulur
-                match = re.search(r'(\d+)', raw_val.replace(",", ""))
-                
-                if match:
-                    clean_id = match.group(1)
-                    self.existing_ids.add(clean_id)
-                    count += 1
-
-            logger.info(f"✅ Loaded {count} unique existing IDs (Regex Safe Mode).")
+            data_rows = None
+            if cached_rows:
+                # Önbellekteki son satırla örtüşen bir satır fazla okunur; silme/sıralama/ekleme
+                # ile kayma olduysa eşleşmez ve tam okumaya düşülür
+                tail = self.sheet.batch_get([f'A{cached_rows + 1}:A'], value_render_option='UNFORMATTED_VALUE')[0]
+                if tail and tail[0] == cached_last:
+                    data_rows = tail[1:]
+                    start_row = cached_rows
+                else:
+                    logger.warning("ID cache does not line up with the sheet anymore, doing a full read.")
+
+            if data_rows is None:
+                # Sadece A sütunu, başlıksız; sayılar biçimlendirilmeden (int/float) gelir
+                data_rows = self.sheet.batch_get(['A2:A'], value_render_option='UNFORMATTED_VALUE')[0]
+                cached_ids = frozenset()
+                start_row = 0
+
+            ids = _extract_ids(data_rows)
+            # Yükleme sonrası değişmez; bu çalışmada eklenenler main() içinde ayrı tutulur
+            self.existing_ids = cached_ids.union(ids)
+            self.ids_loaded = True
+            count = len(ids)
+
+            logger.info(f"✅ Loaded {count} existing IDs from Sheets after row {start_row + 1} (Vectorized Mode), {len(self.existing_ids)} total.")
             # Debug için ilk 3 ID'yi loga basalım ki doğru okuyor mu görelim
             if self.existing_ids:
                 sample_ids = list(self.existing_ids)[:3]
                 logger.info(f"🔍 Sample IDs loaded: {sample_ids}")
 
+            # Bu çalışmada eklenen satırlar önbelleğe yazılmaz; bir sonraki
+            # çalışmada kuyruk okumasıyla gelirler. Önbellek kaydı başarısız olsa
+            # bile eski önbellek daha uzun bir kuyruk okuyarak kendini düzeltir.
+            if data_rows or start_row == 0:
+                last = data_rows[-1] if data_rows else cached_last
+                self._save_id_cache(start_row + len(data_rows), last, self.existing_ids)
+
         except Exception as e:
             logger.error(f"Error loading existing IDs: {e}")
 
+    def _load_id_cache(self):
+        # (okunan veri satırı sayısı, son okunan satır, ID kümesi); önbellek yoksa (0, None, boş küme)
+        if not ID_CACHE_PATH.exists():
+            return 0, None, frozenset()
+        try:
+            n_rows, last_row, ids = pickle.loads(ID_CACHE_PATH.read_bytes())
+            logger.info(f"✅ Loaded {len(ids)} existing IDs from cache ({ID_CACHE_PATH}, {n_rows} rows).")
+            return n_rows, last_row, frozenset(ids)
+        except Exception as e:
+            logger.warning(f"ID cache unreadable, falling back to full Sheets read: {e}")
+            return 0, None, frozenset()
+
+    def _save_id_cache(self, n_rows, last_row, ids):
+        try:
+            ID_CACHE_PATH.write_bytes(pickle.dumps((n_rows, last_row, frozenset(ids)), protocol=5))
+        except Exception as e:
+            logger.error(f"Error writing ID cache: {e}")
+
 class AsyncScraper:
     def __init__(self):
-        raw_cookie = os.environ.get("PRISYNC_COOKIE", "")
-        self.cookies = {}
-        if raw_cookie:
-            for item in raw_cookie.split(";"):
-                if "=" in item:
-                    k, v = item.strip().split("=", 1)
-                    self.cookies[k] = v
-        
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
         }
-        self.results = []
-        self.lock = asyncio.Lock()
+        # Ham cookie string'i olduğu gibi header olarak gönderilir;
+        # değerlerdeki '=' (base64/JWT) bozulmaz, cookie jar devreye girmez
+        raw_cookie = os.environ.get("PRISYNC_COOKIE", "").strip()
+        if raw_cookie:
+            self.headers["Cookie"] = raw_cookie
 
     async def fetch_page(self, session, page_num):
         url = PRISYNC_SITELIST_URL_TEMPLATE.format(page_num)
-        try:
-            async with session.get(url, allow_redirects=False) as response:
-                if response.status == 200:
-                    return await response.text()
-                elif response.status == 302:
-                    logger.warning(f"Page {page_num} redirected. COOKIE MIGHT BE EXPIRED!")
-                else:
-                    logger.warning(f"Page {page_num} failed: {response.status}")
-        except Exception as e:
-            logger.error(f"Error fetching page {page_num}: {e}")
+        waited = 0
+        for attempt in range(MAX_ATTEMPTS):
+            delay = min(2 ** attempt, MAX_BACKOFF) + random.random()
+            try:
+                async with session.get(url, headers=self.headers, allow_redirects=False) as response:
+                    if response.status == 200:
+                        # Ham bayt + HTTP charset: decode/encode turu yok, charset parser'a verilir
+                        return await response.read(), response.charset or "utf-8"
+                    elif response.status == 302:
+                        logger.warning(f"Page {page_num} redirected. COOKIE MIGHT BE EXPIRED!")
+                        return None
+                    elif response.status in RETRY_STATUSES:
+                        retry_after = _parse_retry_after(response.headers.get("Retry-After", ""))
+                        if retry_after is not None:
+                            # Sunucunun bekleme penceresi içinde tekrar denemek boşa gider
+                            if retry_after > MAX_RETRY_WAIT - waited:
+                                logger.error(f"Page {page_num} got {response.status} with Retry-After {retry_after:.0f}s, exceeds retry budget. Giving up.")
+                                return None
+                            delay = retry_after
+                        reason = f"got {response.status}"
+                    else:
+                        logger.warning(f"Page {page_num} failed: {response.status}")
+                        return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reason = f"error {e!r}"
+            except Exception as e:
+                logger.error(f"Error fetching page {page_num}: {e}")
+                return None
+            if attempt == MAX_ATTEMPTS - 1:
+                logger.warning(f"Page {page_num} {reason} ({attempt + 1}/{MAX_ATTEMPTS})")
+                break
+            logger.warning(f"Page {page_num} {reason}, retrying in {delay:.1f}s ({attempt + 1}/{MAX_ATTEMPTS})")
+            await asyncio.sleep(delay)
+            waited += delay
+        logger.error(f"Page {page_num} failed after {MAX_ATTEMPTS} attempts.")
         return None
 
-    def parse_html(self, html):
-        data = []
-        try:
-            soup = BeautifulSoup(html, 'lxml')
-            rows = soup.select("#ff-grid table.items tbody tr")
-            for row in rows:
-                cols = row.find_all("td")
-                if len(cols) >= 3:
-                    seller_name = cols[2].get_text(strip=True)
-                    if not seller_name: 
-                        site_id = cols[0].get_text(strip=True)
-                        site_url = cols[1].get_text(strip=True)
-                        data.append({"ID": site_id, "Site": site_url})
-        except Exception:
-            pass
-        return data
+    async def fetch_and_parse(self, session, page_num):
+        page = await self.fetch_page(session, page_num)
+        if page is None:
+            return []
+        raw, encoding = page
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(EXECUTOR, parse_html, raw, encoding)
 
-    async def worker(self, queue, session):
-        while True:
-            page_num = await queue.get()
-            html = await self.fetch_page(session, page_num)
-            if html:
-                page_data = self.parse_html(html)
-                if page_data:
-                    async with self.lock:
-                        self.results.extend(page_data)
-            queue.task_done()
-
-    async def run(self):
-        queue = asyncio.Queue()
-        for i in range(START_PAGE, END_PAGE + 1):
-            queue.put_nowait(i)
-        
-        connector = aiohttp.TCPConnector(ssl=False)
-        async with aiohttp.ClientSession(cookies=self.cookies, headers=self.headers, connector=connector) as session:
-            tasks = []
-            for i in range(CONCURRENT_REQUESTS):
-                task = asyncio.create_task(self.worker(queue, session))
-                tasks.append(task)
-            await queue.join()
-            for task in tasks: task.cancel()
-        
-        return self.results
+    async def run(self, session):
+        sem = asyncio.Semaphore(CONCURRENT_REQUESTS)
+
+        async def bounded(page_num):
+            async with sem:
+                return await self.fetch_and_parse(session, page_num)
+
+        pages = await asyncio.gather(*(bounded(p) for p in range(START_PAGE, END_PAGE + 1)))
+        return [item for page_data in pages for item in page_data]
 
 class SlackNotifier:
     def __init__(self):
         self.webhook_url = os.environ.get("SLACK_WEBHOOK")
 
-    async def send_notification(self, new_sites):
+    async def send_notification(self, session, new_sites):
         if not self.webhook_url: return
         try:
-            message_text = f"🚨 *{len(new_sites)} Yeni Site Bulundu!* 🚨\n\n"
-            for site in new_sites:
-                message_text += f"• *{site[1]}* (ID: {site[0]})\n  <{site[2]}|Prisync Linki>\n"
+            parts = [f"🚨 *{len(new_sites)} Yeni Site Bulundu!* 🚨\n\n"]
+            parts.extend(f"• *{site[1]}* (ID: {site[0]})\n  <{site[2]}|Prisync Linki>\n" for site in new_sites)
+            message_text = "".join(parts)
             
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                await session.post(self.webhook_url, json={"text": message_text})
-                logger.info("Slack notification sent.")
+            async with session.post(
+                self.webhook_url,
+                data=orjson.dumps({"text": message_text}),
+                headers={"Content-Type": "application/json"},
+            ) as response:
+                if response.status == 200:
+                    logger.info("Slack notification sent.")
+                else:
+                    logger.error(f"Slack error: {response.status}")
         except Exception as e:
             logger.error(f"Slack error: {e}")
 
@@ -199,37 +347,58 @@ async def main():
     except Exception:
         return 
 
-    logger.info("Starting scrape cycle...")
-    scraper = AsyncScraper()
-    found_sites = await scraper.run()
-    logger.info(f"Scrape finished. Found {len(found_sites)} candidates.")
-
-    new_unique_sites = []
-    if found_sites:
-        found_sites.sort(key=lambda x: int(x['ID']) if str(x['ID']).isdigit() else 0, reverse=True)
-        rows_to_add = []
-        for item in found_sites:
-            site_id = str(item['ID']).strip()
-            
-            if site_id not in sheets_manager.existing_ids:
+    if not sheets_manager.ids_loaded:
+        # Mevcut ID'ler bilinmeden ekleme yapılırsa her aday "yeni" sayılır (mükerrer satır + Slack)
+        logger.critical("Existing IDs could not be loaded. Aborting to avoid duplicate rows.")
+        return
+
+    async with create_session() as session:
+        logger.info("Starting scrape cycle...")
+        scraper = AsyncScraper()
+        found_sites = await scraper.run(session)
+        logger.info(f"Scrape finished. Found {len(found_sites)} candidates.")
+
+        new_unique_sites = []
+        if found_sites:
+            # Anahtarlar tek geçişte hesaplanır, sıralama C tarafında tuple[0] üzerinden yapılır
+            keyed = [(int(site['ID']) if site['ID'].isdigit() else 0, site) for site in found_sites]
+            keyed.sort(key=itemgetter(0), reverse=True)
+            found_sites = [site for _, site in keyed]
+            rows_to_add = []
+            existing = sheets_manager.existing_ids
+            added = set()
+            for item in found_sites:
+                site_id = str(item['ID']).strip()
+                if site_id in existing or site_id in added:
+                    continue
+                added.add(site_id)
                 link = f"https://prisync.me/admin/fetchField/site?site_id={site_id}"
-                row = [site_id, item['Site'], link]
-                rows_to_add.append(row)
-                sheets_manager.existing_ids.add(site_id)
+                rows_to_add.append([site_id, item['Site'], link])
         
-        if rows_to_add:
-            try:
-                sheets_manager.sheet.append_rows(rows_to_add)
-                new_unique_sites = rows_to_add
-                logger.info(f"Added {len(rows_to_add)} new sites.")
-            except Exception as e:
-                logger.error(f"Sheets error: {e}")
-        else:
-            logger.info("✅ No new unique sites found (Duplicate check passed).")
+            if rows_to_add:
+                try:
+                    # Sadece yeni satırlar yazılır; sayfa asla baştan yüklenmez
+                    sheets_manager.sheet.append_rows(
+                        rows_to_add,
+                        value_input_option='RAW',
+                        insert_data_option='INSERT_ROWS',
+                    )
+                    new_unique_sites = rows_to_add
+                    logger.info(f"Added {len(rows_to_add)} new sites.")
+                except Exception as e:
+                    logger.error(f"Sheets error: {e}")
+            else:
+                logger.info("✅ No new unique sites found (Duplicate check passed).")
 
-    if new_unique_sites:
-        slack = SlackNotifier()
-        await slack.send_notification(new_unique_sites)
+        if new_unique_sites:
+            slack = SlackNotifier()
+            await slack.send_notification(session, new_unique_sites)
 
 if __name__ == "__main__":
+    # libuv tabanlı event loop; kurulu değilse (ör. Windows) varsayılan loop kullanılır
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     asyncio.run(main())
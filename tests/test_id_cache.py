@@ -0,0 +1,66 @@
+import main
+
+
+class FakeSheet:
+    def __init__(self, column):
+        self.column = column
+        self.ranges = []
+
+    def batch_get(self, ranges, value_render_option=None):
+        (a1,) = ranges
+        self.ranges.append(a1)
+        start = int(a1[1:a1.index(":")])
+        return [[[value] for value in self.column[start - 2:]]]
+
+
+class BrokenSheet:
+    def batch_get(self, ranges, value_render_option=None):
+        raise RuntimeError("quota exceeded")
+
+
+def load(sheet, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "ID_CACHE_PATH", tmp_path / "ids.pkl")
+    manager = main.GoogleSheetsManager("test")
+    manager.sheet = sheet
+    manager._load_existing_ids()
+    return manager
+
+
+def test_cache_reads_only_new_tail(monkeypatch, tmp_path):
+    first = load(FakeSheet([101, 102.0, "site_id=103"]), monkeypatch, tmp_path)
+    assert first.sheet.ranges == ["A2:A"]
+    assert first.existing_ids == {"101", "102", "103"}
+
+    # Önbellek sonrası elle/başka çalışmada eklenen satırlar kuyruktan gelir
+    second = load(FakeSheet([101, 102.0, "site_id=103", "104", 105]), monkeypatch, tmp_path)
+    assert second.sheet.ranges == ["A4:A"]
+    assert second.existing_ids == {"101", "102", "103", "104", "105"}
+
+
+def test_cache_falls_back_to_full_read_after_rows_deleted(monkeypatch, tmp_path):
+    load(FakeSheet([1, 2, 3, 4, 5]), monkeypatch, tmp_path)
+
+    # 2 satır silinip 6 ve 7 eklendi: önbellekteki ofset artık kaymış durumda
+    manager = load(FakeSheet([1, 2, 3, 6, 7]), monkeypatch, tmp_path)
+    assert manager.sheet.ranges == ["A6:A", "A2:A"]
+    assert manager.existing_ids == {"1", "2", "3", "6", "7"}
+
+
+def test_sheets_error_keeps_cached_ids(monkeypatch, tmp_path):
+    load(FakeSheet([1, 2]), monkeypatch, tmp_path)
+
+    manager = load(BrokenSheet(), monkeypatch, tmp_path)
+    assert manager.ids_loaded
+    assert manager.existing_ids == {"1", "2"}
+
+
+def test_sheets_error_without_cache_is_not_loaded(monkeypatch, tmp_path):
+    manager = load(BrokenSheet(), monkeypatch, tmp_path)
+    assert not manager.ids_loaded
+
+
+def test_unreadable_cache_falls_back_to_full_read(monkeypatch, tmp_path):
+    (tmp_path / "ids.pkl").write_bytes(b"not a pickle")
+    manager = load(FakeSheet([7, 8]), monkeypatch, tmp_path)
+    assert manager.sheet.ranges == ["A2:A"]
+    assert manager.existing_ids == {"7", "8"}
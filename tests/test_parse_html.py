@@ -0,0 +1,43 @@
+import main
+
+
+PAGE = """<html><head><meta charset="utf-8"></head><body>
+<div id="ff-grid" class="grid-view">
+<table class="items table">
+<thead><tr><th>ID</th><th>URL</th><th>Seller</th></tr></thead>
+<tbody>
+<tr><td>101</td><td>nbsp.com</td><td>&nbsp;</td></tr>
+<tr><td>102</td><td>empty.com</td><td></td></tr>
+<tr><td>103</td><td>space.com</td><td>  \n\t </td></tr>
+<tr><td><a href="/site?site_id=104">104</a></td><td><a href="#">www.</a><b>linked.com</b></td><td><span>&nbsp;</span><!-- x --></td></tr>
+<tr><td>105</td><td>seller.com</td><td><a href="#">Acme</a></td></tr>
+<tr><td>106</td><td>short.com</td></tr>
+</tbody>
+</table>
+</div>
+</body></html>"""
+
+
+def test_parse_html_keeps_rows_with_blank_seller():
+    rows = main.parse_html(PAGE.encode("utf-8"))
+    assert rows == [
+        {"ID": "101", "Site": "nbsp.com"},
+        {"ID": "102", "Site": "empty.com"},
+        {"ID": "103", "Site": "space.com"},
+        {"ID": "104", "Site": "www.linked.com"},
+    ]
+
+
+def test_parse_html_skips_pages_without_grid():
+    assert main.parse_html(b"<html><body>No results.</body></html>") == []
+
+
+def test_parse_html_uses_given_encoding_without_meta_charset():
+    fragment = (
+        '<div id="ff-grid"><table class="items"><tbody>'
+        "<tr><td>201</td><td>şirket.com.tr</td><td></td></tr>"
+        "</tbody></table></div>"
+    )
+    assert main.parse_html(fragment.encode("utf-8")) == [{"ID": "201", "Site": "şirket.com.tr"}]
+    assert main.parse_html(fragment.encode("iso-8859-9"), "iso-8859-9") == [{"ID": "201", "Site": "şirket.com.tr"}]
+    assert main.parse_html(fragment.encode("utf-8"), "bogus") == [{"ID": "201", "Site": "şirket.com.tr"}]
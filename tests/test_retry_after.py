@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import main
+
+
+def test_parse_retry_after_seconds():
+    assert main._parse_retry_after("60") == 60
+
+
+def test_parse_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=120)
+    delay = main._parse_retry_after(format_datetime(when, usegmt=True))
+    assert 100 < delay <= 120
+
+
+def test_parse_retry_after_invalid():
+    assert main._parse_retry_after("") is None
+    assert main._parse_retry_after("soon") is None
+
+
+class StubResponse:
+    def __init__(self, status, headers=None, body=b""):
+        self.status = status
+        self.headers = headers or {}
+        self.charset = "utf-8"
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class StubSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def fetch(responses, monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(main.asyncio, "sleep", fake_sleep)
+    session = StubSession(responses)
+    result = main.asyncio.run(main.AsyncScraper().fetch_page(session, 1))
+    return result, session.calls, sleeps
+
+
+def test_fetch_page_gives_up_when_retry_after_exceeds_budget(monkeypatch):
+    result, calls, sleeps = fetch([StubResponse(429, {"Retry-After": "60"})], monkeypatch)
+    assert result is None
+    assert calls == 1
+    assert sleeps == []
+
+
+def test_fetch_page_honors_retry_after_then_succeeds(monkeypatch):
+    responses = [StubResponse(429, {"Retry-After": "5"}), StubResponse(200, body=b"ok")]
+    result, calls, sleeps = fetch(responses, monkeypatch)
+    assert result == (b"ok", "utf-8")
+    assert calls == 2
+    assert sleeps == [5]
+
+
+def test_fetch_page_does_not_sleep_after_last_attempt(monkeypatch):
+    responses = [StubResponse(503) for _ in range(main.MAX_ATTEMPTS)]
+    result, calls, sleeps = fetch(responses, monkeypatch)
+    assert result is None
+    assert calls == main.MAX_ATTEMPTS
+    assert len(sleeps) == main.MAX_ATTEMPTS - 1